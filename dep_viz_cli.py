@@ -10,143 +10,140 @@ dep_viz_cli.py — минимальный прототип CLI для визуа
 """
 
 import argparse
+import functools
 import os
-import re
+import string
 import sys
 from urllib.parse import urlparse
 
 VERSION = "0.1"
 
-PACKAGE_RE = re.compile(r"^[A-Za-z0-9_.\-]+$")  # простая проверка имени пакета
+# таблица для str.translate: удаляет все допустимые символы имени пакета,
+# непустой остаток означает недопустимые символы
+_PACKAGE_DELETE = str.maketrans("", "", string.ascii_letters + string.digits + "_.-")
 
 def validate_package(name: str) -> str:
     if not name:
         raise ValueError("Имя пакета не может быть пустым.")
-    if not PACKAGE_RE.match(name):
+    if name.translate(_PACKAGE_DELETE):
         raise ValueError(
             f"Некорректное имя пакета '{name}'. Допустимые символы: буквы, цифры, '_', '-' и '.'."
         )
     return name
 
-def is_url(value: str) -> bool:
-    parsed = urlparse(value)
+@functools.lru_cache(maxsize=256)
+def _parse(value: str):
+    # кэш нужен публичным is_url/is_file_url при повторных проверках одной строки;
+    # validate_repo разбирает значение один раз и передаёт результат дальше
+    return urlparse(value)
+
+def _is_url(parsed) -> bool:
     return parsed.scheme in ("http", "https", "git", "ssh") and bool(parsed.netloc)
 
-def is_file_url(value: str) -> bool:
-    parsed = urlparse(value)
+def _is_file_url(parsed) -> bool:
     return parsed.scheme == "file" and bool(parsed.path)
 
-def validate_repo(repo: str) -> str:
+def is_url(value: str) -> bool:
+    return _is_url(_parse(value))
+
+def is_file_url(value: str) -> bool:
+    return _is_file_url(_parse(value))
+
+def validate_repo(repo: str):
+    """
+    Возвращает (значение, parsed): абсолютный путь и None для локального репозитория
+    или исходный URL и результат urlparse для удалённого.
+    """
     if not repo:
         raise ValueError("Параметр репозитория не задан.")
-    # локальный путь
-    if os.path.exists(repo):
+    # локальный путь: abspath — чисто строковая операция, проверяем существование уже абсолютного пути
+    abs_repo = os.path.abspath(repo)
+    if os.path.exists(abs_repo):
         # путь существует на FS
-        return os.path.abspath(repo)
+        return abs_repo, None
+    parsed = _parse(repo)
     # file:// URI
-    if is_file_url(repo):
-        path = urlparse(repo).path
+    if _is_file_url(parsed):
+        path = parsed.path
         if os.path.exists(path):
-            return os.path.abspath(path)
+            return os.path.abspath(path), None
         raise ValueError(f"file:// путь указан, но файл/папка не найдены: {path}")
     # URL-проверка (http/https/git/ssh)
-    if is_url(repo):
-        return repo
+    if _is_url(parsed):
+        return repo, parsed
     # не распознано
     raise ValueError(
         f"Параметр репозитория '{repo}' не распознан как существующий путь или корректный URL."
     )
 
-def validate_test_mode(mode: str, repo_value: str) -> str:
-    valid = ("none", "readonly", "simulate")
-    if mode not in valid:
-        raise ValueError(f"Некорректный режим тестового репозитория '{mode}'. Допустимые: {valid}")
-    # если режим тестовый — требуем локальный репозиторий (не http URL)
-    if mode != "none":
-        # treat repo_value is local path if it's an absolute path
-        parsed = urlparse(repo_value)
-        if parsed.scheme in ("http", "https", "git", "ssh"):
-            raise ValueError("Тестовый режим требует локального пути к тестовому репозиторию, а не URL.")
-        # also if repo_value is a file://, it's ok (we converted earlier to abs path)
-        if not os.path.exists(repo_value):
-            raise ValueError(f"Тестовый режим включен, но локальный репозиторий не найден: {repo_value}")
-    return mode
+def check_test_mode_vs_repo(repo_value: str, parsed=None) -> None:
+    """
+    Тестовый режим требует локального репозитория (не URL). Значение режима
+    проверяет argparse (choices), здесь — только согласованность с репозиторием.
+    parsed — результат разбора URL из validate_repo (None для локального пути).
+    """
+    # validate_repo возвращает parsed только для URL, принятых _is_url
+    if parsed is not None:
+        raise ValueError("Тестовый режим требует локального пути к тестовому репозиторию, а не URL.")
+    # file:// к этому моменту уже преобразован в абсолютный путь
+    if not os.path.exists(repo_value):
+        raise ValueError(f"Тестовый режим включен, но локальный репозиторий не найден: {repo_value}")
 
 def validate_filter(substr: str) -> str:
-    # фильтр может быть пустым (тогда означает "не фильтровать")
-    if substr is None:
-        return ""
+    # фильтр может быть пустым (тогда означает "не фильтровать"); по умолчанию argparse передаёт ""
     # optionally enforce minimal length (e.g., не пустая строка если передана)
     if substr != "" and len(substr.strip()) == 0:
         raise ValueError("Пустая строка передана как подстрока фильтра.")
     return substr
 
+def _arg_type(validator):
+    """
+    Оборачивает валидатор для type= в argparse: ValueError превращается в
+    ArgumentTypeError, чтобы argparse вывел исходное сообщение.
+    """
+    def convert(value):
+        try:
+            return validator(value)
+        except ValueError as e:
+            raise argparse.ArgumentTypeError(str(e))
+    convert.__name__ = validator.__name__
+    return convert
+
 def parse_args(argv):
     p = argparse.ArgumentParser(description="Минимальный CLI визуализатора зависимостей — Этап 1")
-    p.add_argument("--package", "-p", required=True, help="Имя анализируемого пакета (например my_pkg).")
-    p.add_argument("--repo", "-r", required=True,
+    p.add_argument("--package", "-p", required=True, type=_arg_type(validate_package),
+                   help="Имя анализируемого пакета (например my_pkg).")
+    p.add_argument("--repo", "-r", required=True, type=_arg_type(validate_repo),
                    help="URL репозитория или путь к файлу/папке тестового репозитория.")
     p.add_argument("--test-mode", "-t", default="none",
                    choices=["none", "readonly", "simulate"],
                    help="Режим работы с тестовым репозиторием: none / readonly / simulate.")
-    p.add_argument("--filter", "-f", default=None,
+    p.add_argument("--filter", "-f", default="", type=_arg_type(validate_filter),
                    help="Подстрока для фильтрации пакетов (опционально).")
     p.add_argument("--version", action="version", version=VERSION)
-    return p.parse_args(argv)
+    args = p.parse_args(argv)
+    args.repo, repo_parsed = args.repo
+    # режим зависит от уже проверенного репозитория, поэтому проверяется после разбора
+    if args.test_mode != "none":
+        try:
+            check_test_mode_vs_repo(args.repo, repo_parsed)
+        except ValueError as e:
+            p.error(f"argument --test-mode/-t: {e}")
+    return args
 
 def main(argv=None):
     argv = sys.argv[1:] if argv is None else argv
     try:
+        # все параметры проверяются внутри argparse (type=); при ошибке он печатает сообщение
         args = parse_args(argv)
-    except SystemExit:
-        # argparse уже напечатает help/ошибку; просто выйти с кодом 2
-        return 2
-
-    # Валидация параметров с обработкой ошибок
-    errors = []
-    validated = {}
-    # package
-    try:
-        validated["package"] = validate_package(args.package)
-    except Exception as e:
-        errors.append(f"package: {e}")
-
-    # repo
-    repo_value = None
-    try:
-        repo_value = validate_repo(args.repo)
-        validated["repo"] = repo_value
-    except Exception as e:
-        errors.append(f"repo: {e}")
-
-    # test-mode
-    try:
-        # для проверки может понадобиться repo_value; если repo_value невалиден — всё равно сообщим об ошибке repo
-        rm = args.test_mode
-        # если repo_value is None (еще не валидирован) — передаём оригинал args.repo
-        repo_for_mode = repo_value if repo_value is not None else args.repo
-        validated["test_mode"] = validate_test_mode(rm, repo_for_mode)
-    except Exception as e:
-        errors.append(f"test_mode: {e}")
-
-    # filter
-    try:
-        validated["filter"] = validate_filter(args.filter)
-    except Exception as e:
-        errors.append(f"filter: {e}")
-
-    # Если есть ошибки — вывести и завершить с кодом 1
-    if errors:
-        print("Обнаружены ошибки при обработке параметров:", file=sys.stderr)
-        for err in errors:
-            print("  -", err, file=sys.stderr)
-        return 1
+    except SystemExit as e:
+        # argparse уже напечатал help/ошибку; --help/--version завершаются с кодом 0
+        return e.code
 
     # Вывести все параметры в формате ключ=значение (требование)
     print("Запущено приложение с параметрами:")
     for k in ("package", "repo", "test_mode", "filter"):
-        v = validated.get(k, "")
-        print(f"{k}={v}")
+        print(f"{k}={getattr(args, k)}")
 
     # Здесь на следующих этапах будет основной алгоритм анализа зависимостей и визуализации.
     return 0
@@ -3,67 +3,342 @@
 Этап 2. Сбор данных о зависимостях пакетов Alpine Linux
 """
 import argparse
+import gzip
+import hashlib
+import os
+import pickle
+import queue
+import shutil
 import tarfile
+import threading
+import urllib.error
 import urllib.request
-import tempfile
-import os
 import sys
+import zlib
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from urllib.parse import urlsplit
+
+try:
+    # python-isal: ускоренная (ISA-L) распаковка gzip; если не установлен — используется stdlib
+    from isal import igzip
+except ImportError:
+    igzip = None
+
+try:
+    # requests: пул keep-alive соединений; без него каждый запрос открывает новое соединение (urllib)
+    import requests
+    from requests.adapters import HTTPAdapter
+except ImportError:
+    requests = None
+
+# Зеркала Alpine (корень дерева alpine/), между которыми выбирается самое быстрое
+DEFAULT_MIRRORS = (
+    "https://dl-cdn.alpinelinux.org/alpine",
+    "https://mirrors.edge.kernel.org/alpine",
+    "https://mirror.yandex.ru/mirrors/alpine",
+)
+MIRROR_TIMEOUT = 5
+# Скачанные APKINDEX.tar.gz хранятся здесь вместе с ETag для условных запросов
+CACHE_DIR = os.path.join(Path.home(), ".cache", "dep_viz")
+
+def _make_session():
+    session = requests.Session()
+    session.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=8))
+    session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8))
+    return session
+
+# общая сессия переиспользует TCP/TLS соединения между последовательными запросами
+# к одному зеркалу; requests не гарантирует потокобезопасность Session, поэтому
+# параллельные попытки в _race получают собственные сессии
+_SESSION = _make_session() if requests is not None else None
 
 def parse_args(argv=None):
     parser = argparse.ArgumentParser(description="Stage 2: get Alpine package dependencies")
     parser.add_argument("--package", "-p", required=True, help="Имя пакета для анализа")
     parser.add_argument("--repo-url", "-r", required=True, help="URL репозитория Alpine (например, http://dl-cdn.alpinelinux.org/alpine/v3.18/main/x86_64/)")
+    parser.add_argument("--mirrors", "-m", default=",".join(DEFAULT_MIRRORS),
+                        help="Список зеркал Alpine через запятую (пустая строка — не использовать зеркала)")
     return parser.parse_args(argv)
 
-def download_apkindex(repo_url: str) -> str:
+def _mirror_key(url: str):
+    parts = urlsplit(url)
+    return parts.netloc.lower(), parts.path
+
+def candidate_urls(repo_url: str, mirrors) -> list:
+    """
+    Строит список URL APKINDEX.tar.gz: сам репозиторий плюс тот же путь на каждом зеркале
+    """
+    repo_url = repo_url.rstrip("/")
+    urls = [repo_url + "/APKINDEX.tar.gz"]
+    # одно и то же зеркало по http и https не запрашиваем дважды
+    seen = {_mirror_key(urls[0])}
+    # путь вида .../alpine/v3.18/main/x86_64 переносится на зеркала
+    if "/alpine/" in repo_url:
+        suffix = repo_url.split("/alpine/", 1)[1]
+        for mirror in mirrors:
+            url = f"{mirror.rstrip('/')}/{suffix}/APKINDEX.tar.gz"
+            key = _mirror_key(url)
+            if key not in seen:
+                seen.add(key)
+                urls.append(url)
+    return urls
+
+def cache_path_for(repo_url: str) -> str:
+    """
+    Путь к кэшированному APKINDEX.tar.gz для данного репозитория
+    """
+    key = hashlib.sha1(repo_url.rstrip("/").encode()).hexdigest()
+    return os.path.join(CACHE_DIR, key + ".tar.gz")
+
+class _SessionResponse:
     """
-    Скачивает APKINDEX.tar.gz с репозитория в временный файл
+    Приводит requests.Response к интерфейсу ответа urllib: status, headers, read(), close()
     """
-    index_url = repo_url.rstrip("/") + "/APKINDEX.tar.gz"
-    tmp_fd, tmp_path = tempfile.mkstemp(suffix=".tar.gz")
-    os.close(tmp_fd)
-    print(f"Скачивание {index_url} ...")
+    def __init__(self, resp):
+        self._resp = resp
+        self.status = resp.status_code
+        self.headers = resp.headers
+
+    def read(self, *args):
+        # после чтения до конца urllib3 сам возвращает соединение в пул;
+        # байты не декодируются — как и urllib, сохраняем архив ровно в том виде, в каком он отдан
+        return self._resp.raw.read(*args, decode_content=False)
+
+    def close(self):
+        self._resp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def _open_index(url: str, headers: dict, session=None):
+    if session is not None:
+        # requests по умолчанию просит gzip; identity — как urllib, без дополнительного сжатия
+        headers = {**headers, "Accept-Encoding": "identity"}
+        resp = session.get(url, headers=headers, stream=True, timeout=MIRROR_TIMEOUT)
+        if resp.status_code != 304:
+            try:
+                resp.raise_for_status()
+            except requests.HTTPError:
+                resp.close()
+                raise
+        return _SessionResponse(resp)
+    req = urllib.request.Request(url, headers=headers)
     try:
-        urllib.request.urlretrieve(index_url, tmp_path)
-    except Exception as e:
-        os.remove(tmp_path)
-        raise RuntimeError(f"Ошибка скачивания APKINDEX: {e}")
-    return tmp_path
+        return urllib.request.urlopen(req, timeout=MIRROR_TIMEOUT)
+    except urllib.error.HTTPError as e:
+        # 304 Not Modified urllib оформляет как ошибку, но для нас это успешный ответ
+        if e.code == 304:
+            return e
+        raise
+
+def _close_losers(results: queue.Queue, count: int):
+    # проигравшие соединения закрываем сразу, как только они откроются
+    for _ in range(count):
+        _, resp, _ = results.get()
+        if resp is not None:
+            resp.close()
 
-def extract_dependencies(apkindex_path: str, package_name: str):
+def _race(urls, headers: dict):
     """
-    Извлекает прямые зависимости заданного пакета из APKINDEX.tar.gz
+    Параллельно открывает все URL и возвращает (url, ответ) первого успешного.
+    Попытки идут в daemon-потоках: медленные зеркала не задерживают завершение процесса.
     """
-    dependencies = []
-    with tarfile.open(apkindex_path, "r:gz") as tar:
-        # Внутри tar могут быть несколько файлов (обычно APKINDEX)
-        for member in tar.getmembers():
+    results = queue.Queue()
+    # один запрос не конкурирует ни с кем и может использовать общую сессию
+    racing = _SESSION is not None and len(urls) > 1
+
+    def attempt(url):
+        try:
+            session = _make_session() if racing else _SESSION
+            results.put((url, _open_index(url, headers, session), None))
+        except Exception as e:
+            results.put((url, None, e))
+
+    for url in urls:
+        threading.Thread(target=attempt, args=(url,), daemon=True).start()
+    errors = []
+    for received in range(1, len(urls) + 1):
+        url, resp, err = results.get()
+        if err is None:
+            threading.Thread(target=_close_losers, args=(results, len(urls) - received),
+                             daemon=True).start()
+            return url, resp
+        errors.append(f"{url}: {err}")
+    raise RuntimeError("Ошибка скачивания APKINDEX: " + "; ".join(errors))
+
+def clear_cache(repo_url: str):
+    """
+    Удаляет кэшированный архив репозитория вместе с .etag, .pkl и недописанными .part
+    """
+    cache_path = cache_path_for(repo_url)
+    for path in (cache_path, cache_path + ".etag", cache_path + ".pkl",
+                 cache_path + ".part", cache_path + ".pkl.part"):
+        if os.path.exists(path):
+            os.remove(path)
+
+def download_apkindex(repo_url: str, mirrors=()):
+    """
+    Возвращает открытый файл APKINDEX.tar.gz из локального кэша, предварительно
+    обновив его условным GET (If-None-Match / If-Modified-Since).
+    Запросы уходят параллельно на репозиторий и зеркала, используется первый ответивший.
+    """
+    cache_path = cache_path_for(repo_url)
+    etag_path = cache_path + ".etag"
+    headers = {}
+    if os.path.exists(cache_path):
+        if os.path.exists(etag_path):
+            with open(etag_path, encoding="utf-8") as fp:
+                headers["If-None-Match"] = fp.read().strip()
+        # mtime кэша выставляется по Last-Modified сервера
+        headers["If-Modified-Since"] = formatdate(os.path.getmtime(cache_path), usegmt=True)
+
+    urls = candidate_urls(repo_url, mirrors)
+    print(f"Скачивание {urls[0]} ...")
+    try:
+        url, resp = _race(urls, headers)
+    except RuntimeError as e:
+        if not headers:
+            raise
+        print(f"Предупреждение: {e}; используется кэш", file=sys.stderr)
+        return open(cache_path, "rb")
+    if url != urls[0]:
+        print(f"Используется зеркало {url}")
+
+    with resp:
+        if resp.status == 304:
+            print("APKINDEX не изменился, используется кэш")
+            return open(cache_path, "rb")
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp_path = cache_path + ".part"
+        try:
+            with open(tmp_path, "wb") as out:
+                shutil.copyfileobj(resp, out)
+        except BaseException:
+            # недокачанный файл не оставляем в кэше; прежний архив остаётся нетронутым
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        os.replace(tmp_path, cache_path)
+        etag = resp.headers.get("ETag")
+        last_modified = resp.headers.get("Last-Modified")
+
+    if etag:
+        with open(etag_path, "w", encoding="utf-8") as fp:
+            fp.write(etag)
+    elif os.path.exists(etag_path):
+        os.remove(etag_path)
+    if last_modified:
+        try:
+            ts = parsedate_to_datetime(last_modified).timestamp()
+            os.utime(cache_path, (ts, ts))
+        except (TypeError, ValueError):
+            pass
+    return open(cache_path, "rb")
+
+def parse_apkindex(apkindex_file) -> dict:
+    """
+    Разбирает APKINDEX.tar.gz за один проход и строит индекс {имя пакета: [зависимости]}.
+    Имена и зависимости хранятся в bytes.
+    """
+    index = {}
+    # r| — потоковый режим: распаковка идёт по мере чтения, только вперёд
+    if igzip is not None:
+        tar = tarfile.open(fileobj=igzip.GzipFile(fileobj=apkindex_file), mode="r|")
+    else:
+        tar = tarfile.open(fileobj=apkindex_file, mode="r|gz")
+    with tar:
+        # Внутри tar лежат DESCRIPTION, подпись и сам APKINDEX — нужен только последний.
+        # Итерация по tar (а не getmembers()) читает заголовки по одному и допускает ранний выход
+        for member in tar:
+            if member.name != "APKINDEX":
+                continue
             f = tar.extractfile(member)
             if not f:
                 continue
-            content = f.read().decode("utf-8", errors="ignore")
-            # Пакет разделяется блоками, каждый блок начинается с P: (package name)
-            blocks = content.split("\n\n")
-            for block in blocks:
-                lines = block.strip().split("\n")
-                pkg_name = None
-                depends = []
-                for line in lines:
-                    if line.startswith("P:"):
-                        pkg_name = line[2:].strip()
-                    elif line.startswith("D:"):
-                        depends = line[2:].strip().split()
-                if pkg_name == package_name:
-                    dependencies = depends
-                    return dependencies
-    return dependencies
+            # Читаем построчно, не загружая весь индекс в память.
+            # Ключи полей и имена пакетов — ASCII, поэтому работаем с байтами без декодирования
+            pkg_name = None
+            depends = []
+            for raw in f:
+                line = raw.rstrip(b"\n")
+                # Пустая строка — конец блока пакета
+                if not line:
+                    if pkg_name is not None:
+                        index[pkg_name] = depends
+                    pkg_name = None
+                    depends = []
+                elif line.startswith(b"P:"):
+                    pkg_name = line[2:].strip()
+                elif line.startswith(b"D:"):
+                    depends = line[2:].split()
+            # последний блок может не заканчиваться пустой строкой
+            if pkg_name is not None:
+                index[pkg_name] = depends
+            # APKINDEX в архиве один — остаток tar не читаем
+            break
+    return index
+
+def load_index(apkindex_file) -> dict:
+    """
+    Возвращает индекс пакетов для кэшированного APKINDEX.tar.gz. Разобранный индекс
+    сохраняется рядом с архивом (.pkl) и используется повторно, пока архив не изменился.
+    """
+    st = os.stat(apkindex_file.name)
+    # архив перезаписывается только при новом скачивании, поэтому размера и mtime достаточно
+    source_key = (st.st_size, st.st_mtime_ns)
+    pickle_path = apkindex_file.name + ".pkl"
+    if os.path.exists(pickle_path):
+        try:
+            with open(pickle_path, "rb") as fp:
+                cached_key, index = pickle.load(fp)
+            if cached_key == source_key:
+                return index
+        except Exception:
+            # повреждённый pickle может бросить что угодно (MemoryError, KeyError, ...);
+            # промах кэша безопасен — удаляем файл и разбираем архив заново
+            os.remove(pickle_path)
+
+    index = parse_apkindex(apkindex_file)
+    tmp_path = pickle_path + ".part"
+    with open(tmp_path, "wb") as fp:
+        pickle.dump((source_key, index), fp, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, pickle_path)
+    return index
+
+def fetch_index(repo_url: str, mirrors=()) -> dict:
+    """
+    Скачивает (или берёт из кэша) APKINDEX и возвращает индекс пакетов.
+    Если кэшированный архив повреждён, кэш очищается и архив скачивается заново.
+    """
+    # ошибки скачивания пробрасываются как есть: повреждённым считается только архив,
+    # который не удалось разобрать
+    with download_apkindex(repo_url, mirrors) as apkindex_file:
+        try:
+            return load_index(apkindex_file)
+        except (tarfile.ReadError, gzip.BadGzipFile, EOFError, zlib.error) as e:
+            # иначе сервер снова ответит 304 на mtime испорченного файла
+            print(f"Предупреждение: кэш APKINDEX повреждён ({e}), скачивание заново", file=sys.stderr)
+    clear_cache(repo_url)
+    with download_apkindex(repo_url, mirrors) as apkindex_file:
+        return load_index(apkindex_file)
+
+def extract_dependencies(index: dict, package_name: str):
+    """
+    Возвращает прямые зависимости заданного пакета из индекса, построенного parse_apkindex/load_index
+    """
+    # APKINDEX всегда в UTF-8, имена зависимостей — ASCII: строгое декодирование идёт по быстрому пути
+    return [dep.decode() for dep in index.get(package_name.encode(), [])]
 
 def main(argv=None):
     args = parse_args(argv)
     try:
-        apkindex_file = download_apkindex(args.repo_url)
-        deps = extract_dependencies(apkindex_file, args.package)
-        os.remove(apkindex_file)
+        mirrors = [m for m in args.mirrors.split(",") if m.strip()]
+        index = fetch_index(args.repo_url, mirrors)
+        deps = extract_dependencies(index, args.package)
         if deps:
             print(f"Прямые зависимости пакета '{args.package}':")
             for dep in deps: